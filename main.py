@@ -1,21 +1,64 @@
+import asyncio
+import itertools
+import json
+import logging
 import os
-from contextlib import asynccontextmanager
-from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import re
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache, wraps
+from operator import eq, ge, gt, le, lt, ne
+from typing import Any, AsyncIterator, Dict, FrozenSet, Iterator, List, Literal, NamedTuple, Optional, Set, Tuple, Union
 
+import asyncpg
+import httpx
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
-from supabase import Client, create_client
-from postgrest import APIError
+from mcp.types import TextContent
+from supabase import AsyncClient, AsyncClientOptions, acreate_client
+from postgrest import APIError, APIResponse
+# pydantic-core's Rust JSON parser, which postgrest also decodes its responses with
+from pydantic_core import from_json
+from postgrest._async.request_builder import send_with_retry
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_TIMEOUT
+from postgrest.exceptions import generate_default_error_message
 from pathlib import Path
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Connection pool shared by the Supabase client's services (PostgREST, Storage, ...).
+# Connections are kept alive between tool calls so that each request does not pay for
+# a new TCP and TLS handshake.
+HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=50, keepalive_expiry=300)
+
+# Supabase client created by the lifespan, cached here so tools can reach it
+# without resolving the request context on every call.
+_ASYNC_SUPABASE: Optional[AsyncClient] = None
+# Optional direct Postgres connection pool, used for reads when SUPABASE_DB_URL is set
+_DB_POOL: Optional[asyncpg.Pool] = None
+
+class LifespanContext(NamedTuple):
+    """The clients created by the lifespan, available as the request context's lifespan_context."""
+
+    supabase_client: AsyncClient
+    db_pool: Optional[asyncpg.Pool]
+
+
 # Define the lifespan context for the MCP server
 @asynccontextmanager
-async def lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
+async def lifespan(server: FastMCP) -> AsyncIterator[LifespanContext]:
     """
     Manage the lifecycle of the MCP server, initializing the Supabase client on startup.
+
+    Only the async client is created: the tools use it so that independent tool calls can
+    overlap their network I/O instead of blocking the event loop, and a sync client would
+    only hold an idle connection pool. If SUPABASE_DB_URL is set, a connection pool to the
+    database is opened as well, which read_rows uses to bypass PostgREST for the queries it
+    can express in SQL.
     """
     url = os.environ.get("SUPABASE_URL")
     key = os.environ.get("SUPABASE_SERVICE_KEY")
@@ -23,50 +66,753 @@ async def lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
     if not url or not key:
         raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in environment variables.")
 
-    supabase_client: Client = create_client(url, key)
-    yield {"supabase_client": supabase_client}
+    global _ASYNC_SUPABASE, _DB_POOL
+    # Everything opened so far is closed again if a later step (e.g. connecting to the
+    # database) fails, as well as on shutdown
+    async with AsyncExitStack() as stack:
+        async_http_client = await stack.enter_async_context(httpx.AsyncClient(
+            limits=HTTP_LIMITS, timeout=DEFAULT_POSTGREST_CLIENT_TIMEOUT, follow_redirects=True, http2=True
+        ))
+        async_supabase_client: AsyncClient = await acreate_client(
+            url, key, AsyncClientOptions(httpx_client=async_http_client)
+        )
+        logger.info(
+            "Supabase HTTP connection pool: max_connections=%s, max_keepalive_connections=%s, keepalive_expiry=%ss",
+            HTTP_LIMITS.max_connections,
+            HTTP_LIMITS.max_keepalive_connections,
+            HTTP_LIMITS.keepalive_expiry,
+        )
+        db_url = os.environ.get("SUPABASE_DB_URL")
+        db_pool = (
+            await stack.enter_async_context(
+                asyncpg.create_pool(db_url, min_size=2, max_size=10, statement_cache_size=256)
+            )
+            if db_url
+            else None
+        )
+        _ASYNC_SUPABASE = async_supabase_client
+        _DB_POOL = db_pool
+        try:
+            yield LifespanContext(async_supabase_client, db_pool)
+        finally:
+            _ASYNC_SUPABASE = None
+            _DB_POOL = None
+
+# A filter is either a (column_name, operator, value) predicate (or an equivalent Filter), or a compound node
+# combining other filters: ("and", [filters...]), ("or", [filters...]) or ("not", filter).
+FilterSpec = Union[Tuple[str, str, Any], Tuple[str, Any]]
+
+# Map each supported filter operator to the PostgREST operator implementing it
+_OP_TABLE = {
+    "eq": "eq",
+    "neq": "neq",
+    "gt": "gt",
+    "lt": "lt",
+    "gte": "gte",
+    "lte": "lte",
+    "like": "like",
+    "in": "in",
+}
+
+
+def _postgrest_operator(operator: str) -> str:
+    try:
+        return _OP_TABLE[operator]
+    except KeyError:
+        # If an unsupported operator is provided, raise an error
+        raise ValueError(f"Unsupported filter operator: {operator}") from None
+
+
+@dataclass(slots=True, frozen=True)
+class Filter:
+    """
+    A (column, operator, value) predicate whose operator is validated and resolved once,
+    when the filter is created, instead of on every query it is applied to.
+
+    A Filter can be used anywhere a predicate tuple is accepted, and unpacks like one.
+    """
+
+    column: str
+    op: str
+    value: Any
+    method: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "method", _postgrest_operator(self.op))
+
+    def __len__(self) -> int:
+        return 3
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter((self.column, self.op, self.value))
+
+
+def _predicate_operator(spec: FilterSpec) -> str:
+    """Return the PostgREST operator of a predicate, using the one resolved by a Filter if possible."""
+    if isinstance(spec, Filter):
+        return spec.method
+    return _postgrest_operator(spec[1])
+
+
+def _serialize_value(value: Any) -> str:
+    """Serialize a filter value the way PostgREST expects it (null, true/false, compact JSON)."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"))
+    return str(value)
+
+
+def _pg_quote(value: Any) -> str:
+    """Quote a value for use inside a PostgREST filter string if it contains reserved characters."""
+    text = _serialize_value(value)
+    if any(char in text for char in ',.:()"\\'):
+        escaped = text.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+    return text
+
+
+def _filter_criteria(operator: str, value: Any) -> str:
+    """
+    Serialize a filter's value once, so it can be passed straight to the query builder's
+    low-level filter() instead of going through the per-operator helpers.
+    """
+    if operator == "in":
+        return f"({','.join(_pg_quote(item) for item in value)})"
+    return _serialize_value(value)
+
+
+def _encode_filter(spec: FilterSpec) -> str:
+    """
+    Encode a filter in PostgREST's logical tree syntax, e.g. ("or", [("a", "eq", 1), ("b", "gt", 2)])
+    becomes "or(a.eq.1,b.gt.2)".
+    """
+    if len(spec) == 2:
+        kind, operand = spec
+        if kind == "not":
+            if len(operand) == 3:
+                column, operator, value = operand
+                return f"{column}.not.{_encode_predicate(operator, value)}"
+            return f"not.{_encode_filter(operand)}"
+        if kind in ("and", "or"):
+            return f"{kind}({','.join(_encode_filter(child) for child in operand)})"
+        raise ValueError(f"Unsupported logical operator: {kind}")
+    column, operator, value = spec
+    return f"{column}.{_encode_predicate(operator, value)}"
+
+
+def _encode_predicate(operator: str, value: Any) -> str:
+    postgrest_operator = _postgrest_operator(operator)
+    if operator == "in":
+        return f"{postgrest_operator}.{_filter_criteria(operator, value)}"
+    return f"{postgrest_operator}.{_pg_quote(value)}"
 
 
-def _apply_filters(query, filters: List[Tuple[str, str, Any]]):
-    """Helper function to apply a list of filters to a Supabase query."""
-    for column, operator, value in filters:
-        # Match the operator to the corresponding Supabase query builder method
+# Filter lists at least this long are sent as a single logical tree rather than one
+# query parameter per filter
+_LOGICAL_TREE_MIN_FILTERS = 4
+
+
+def _apply_filters(query, filters: List[FilterSpec]):
+    """
+    Helper function to apply a list of filters to a Supabase query.
+
+    Plain predicates and "and" nodes are applied as chained query builder calls, while
+    "or" and "not" nodes are encoded in PostgREST's logical tree syntax, so the whole
+    predicate is evaluated by the database. Long filter lists are encoded as one tree.
+    """
+    if len(filters) == 1 and len(filters[0]) == 3:
+        # Most reads filter on a single column's value; apply it without the generic dispatch.
+        # The predicate is unpacked rather than indexed, so this works for Filters as well.
+        column, operator, value = filters[0]
         if operator == "eq":
-            query = query.eq(column, value)
-        elif operator == "neq":
-            query = query.neq(column, value)
-        elif operator == "gt":
-            query = query.gt(column, value)
-        elif operator == "lt":
-            query = query.lt(column, value)
-        elif operator == "gte":
-            query = query.gte(column, value)
-        elif operator == "lte":
-            query = query.lte(column, value)
-        elif operator == "like":
-            query = query.like(column, value)
-        elif operator == "in":
-            query = query.in_(column, value)
+            return query.filter(column, "eq", _serialize_value(value))
+    if len(filters) >= _LOGICAL_TREE_MIN_FILTERS:
+        # A single-element "or" holding an "and" of every filter adds one parameter to the
+        # URL, instead of the query builder rebuilding its parameters once per filter
+        return query.or_(f"and({','.join(_encode_filter(spec) for spec in filters)})")
+    for spec in filters:
+        if len(spec) == 3:
+            column, operator, value = spec
+            query = query.filter(column, _predicate_operator(spec), _filter_criteria(operator, value))
+            continue
+        kind, operand = spec
+        if kind == "and":
+            query = _apply_filters(query, operand)
+        elif kind == "or":
+            query = query.or_(",".join(_encode_filter(child) for child in operand))
+        elif kind == "not" and len(operand) == 3:
+            column, operator, value = operand
+            query = query.not_.filter(column, _predicate_operator(operand), _filter_criteria(operator, value))
+        elif kind == "not":
+            # A single-element "or" lets PostgREST evaluate an arbitrary negated subtree
+            query = query.or_(_encode_filter(spec))
         else:
-            # If an unsupported operator is provided, raise an error
-            raise ValueError(f"Unsupported filter operator: {operator}")
+            raise ValueError(f"Unsupported logical operator: {kind}")
     return query
 
 
+# SQL equivalents of the filter operators, for reads served from the direct connection
+_SQL_OPERATORS = {
+    "eq": "=",
+    "neq": "<>",
+    "gt": ">",
+    "lt": "<",
+    "gte": ">=",
+    "lte": "<=",
+    "like": "LIKE",
+    "in": "= ANY",
+}
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def _sql_identifier(name: str) -> Optional[str]:
+    """Quote a plain table or column name, or return None if it is anything more complex."""
+    name = name.strip()
+    return f'"{name}"' if _IDENTIFIER.fullmatch(name) else None
+
+
+def _filter_signature(spec: FilterSpec) -> Tuple[Any, ...]:
+    """
+    Describe the shape of a filter without its values, e.g. ("or", (("pred", "id", "gt"), ...)).
+    The generated SQL only depends on this shape, so it can be cached and reused across calls.
+    """
+    if len(spec) == 2:
+        kind, operand = spec
+        if kind == "not":
+            return (kind, _filter_signature(operand))
+        if kind in ("and", "or"):
+            return (kind, tuple(_filter_signature(child) for child in operand))
+        raise ValueError(f"Unsupported logical operator: {kind}")
+    column, operator, _ = spec
+    _predicate_operator(spec)  # Reject unsupported operators
+    return ("pred", column, operator)
+
+
+def _filter_values(filters: List[FilterSpec], args: List[Any]) -> List[Any]:
+    """Append the filters' values to args, in the order their placeholders appear in the SQL."""
+    for spec in filters:
+        if len(spec) == 2:
+            kind, operand = spec
+            _filter_values([operand] if kind == "not" else operand, args)
+            continue
+        _, operator, value = spec
+        if operator == "in":
+            args.append(list(value))
+        elif operator == "like":
+            # PostgREST accepts * as an alias for the % wildcard. Patterns are text, which
+            # PostgREST also sends non-string values as.
+            args.append(str(value).replace("*", "%"))
+        else:
+            args.append(value)
+    return args
+
+
+def _sql_condition(signature: Tuple[Any, ...], params: Iterator[int]) -> Optional[str]:
+    """
+    Translate a filter signature to a SQL condition, numbering its placeholders from params.
+    Returns None if the filter references something other than a plain column.
+    """
+    if signature[0] == "pred":
+        _, column, operator = signature
+        identifier = _sql_identifier(column)
+        if identifier is None:
+            return None
+        if operator == "in":
+            return f"{identifier} = ANY(${next(params)})"
+        return f"{identifier} {_SQL_OPERATORS[operator]} ${next(params)}"
+
+    kind, operand = signature
+    if kind == "not":
+        condition = _sql_condition(operand, params)
+        return None if condition is None else f"NOT ({condition})"
+    conditions = [_sql_condition(child, params) for child in operand]
+    if not conditions:
+        return "TRUE" if kind == "and" else "FALSE"
+    if None in conditions:
+        return None
+    return "(" + f" {kind.upper()} ".join(conditions) + ")"
+
+
+def _sql_where(signature: Tuple[Tuple[Any, ...], ...], params: Iterator[int]) -> Optional[str]:
+    """Translate filters to a WHERE clause (empty without filters), or None if they cannot be."""
+    conditions = [_sql_condition(spec, params) for spec in signature]
+    if None in conditions:
+        return None
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def _sql_column_list(data_columns: List[str]) -> Optional[str]:
+    identifiers = [_sql_identifier(column) for column in data_columns]
+    return None if not identifiers or None in identifiers else ", ".join(identifiers)
+
+
+@lru_cache(maxsize=256)
+def _select_template(
+    table_name: str,
+    columns: str,
+    signature: Tuple[Tuple[Any, ...], ...],
+    limited: bool,
+    order_by: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Build the SQL for one shape of read. Cached, so repeated reads of the same shape skip
+    rebuilding it and send identical SQL, which reuses asyncpg's prepared statement.
+    """
+    table = _sql_identifier(table_name)
+    select_list = "*" if columns.strip() == "*" else _sql_column_list(columns.split(","))
+    params = itertools.count(1)
+    where = _sql_where(signature, params)
+    order = _sql_identifier(order_by) if order_by is not None else ""
+    if table is None or select_list is None or where is None or order is None:
+        return None
+
+    sql = f"SELECT {select_list} FROM public.{table}{where}"
+    if order:
+        sql += f" ORDER BY {order}"
+    if limited:
+        sql += f" LIMIT ${next(params)}"
+    return sql
+
+
+def _build_select_sql(
+    table_name: str,
+    columns: str,
+    filters: Optional[List[FilterSpec]],
+    limit: Optional[int] = None,
+    order_by: Optional[str] = None,
+) -> Optional[Tuple[str, List[Any]]]:
+    """
+    Build a parameterized query equivalent to a PostgREST read, or return None if the read
+    uses PostgREST features (embedded resources, JSON paths, ...) that have no direct translation.
+    """
+    filters = filters or []
+    signature = tuple(_filter_signature(spec) for spec in filters)
+    sql = _select_template(table_name, columns, signature, limit is not None, order_by)
+    if sql is None:
+        return None
+    args = _filter_values(filters, [])
+    if limit is not None:
+        args.append(limit)
+    return sql, args
+
+
+def _returning_json(sql: str) -> str:
+    """Wrap a data-modifying statement so it returns the affected rows as a JSON array."""
+    return f"WITH _row AS ({sql} RETURNING *) SELECT coalesce(json_agg(_row), '[]')::text FROM _row"
+
+
+def _build_insert_sql(table_name: str, data: List[Dict[str, Any]]) -> Optional[Tuple[str, List[Any]]]:
+    """
+    Build an insert of the given rows. The rows are sent as a single JSON parameter and
+    expanded with json_populate_recordset, which casts each value to its column's type the
+    same way PostgREST does.
+    """
+    table = _sql_identifier(table_name)
+    column_list = _sql_column_list(list(dict.fromkeys(column for row in data for column in row)))
+    if table is None or column_list is None:
+        return None
+    sql = (
+        f"INSERT INTO public.{table} ({column_list}) "
+        f"SELECT {column_list} FROM json_populate_recordset(NULL::public.{table}, $1::json)"
+    )
+    return _returning_json(sql), [json.dumps(data)]
+
+
+def _build_update_sql(
+    table_name: str, data: Dict[str, Any], filters: List[FilterSpec]
+) -> Optional[Tuple[str, List[Any]]]:
+    table = _sql_identifier(table_name)
+    column_list = _sql_column_list(list(data))
+    # $1 holds the new values, so the filter placeholders start at $2
+    where = _sql_where(tuple(_filter_signature(spec) for spec in filters), itertools.count(2))
+    args = _filter_values(filters, [json.dumps(data)])
+    if table is None or column_list is None or where is None:
+        return None
+    sql = (
+        f"UPDATE public.{table} SET ({column_list}) = "
+        f"(SELECT {column_list} FROM json_populate_record(NULL::public.{table}, $1::json)){where}"
+    )
+    return _returning_json(sql), args
+
+
+def _build_delete_sql(table_name: str, filters: List[FilterSpec]) -> Optional[Tuple[str, List[Any]]]:
+    table = _sql_identifier(table_name)
+    where = _sql_where(tuple(_filter_signature(spec) for spec in filters), itertools.count(1))
+    args = _filter_values(filters, [])
+    if table is None or where is None:
+        return None
+    return _returning_json(f"DELETE FROM public.{table}{where}"), args
+
+
+# Comparisons allowed in an aggregate's "having" condition
+_HAVING_OPERATORS = {"eq": eq, "neq": ne, "gt": gt, "lt": lt, "gte": ge, "lte": le}
+
+
+def _having_operator(operator: str):
+    try:
+        return _HAVING_OPERATORS[operator]
+    except KeyError:
+        raise ValueError(f"Unsupported having operator: {operator}") from None
+
+
+def _build_aggregate_sql(
+    table_name: str,
+    agg: str,
+    column: str,
+    filters: Optional[List[FilterSpec]],
+    having: Optional[Tuple[str, Any]],
+) -> Optional[Tuple[str, List[Any]]]:
+    """
+    Build an aggregate query, with filters as its WHERE clause and the having condition as
+    its HAVING clause, so that only the aggregated value ever leaves the database.
+    """
+    filters = filters or []
+    table = _sql_identifier(table_name)
+    target = "*" if agg == "count" and column.strip() == "*" else _sql_identifier(column)
+    where = _sql_where(tuple(_filter_signature(spec) for spec in filters), itertools.count(1))
+    if table is None or target is None or where is None:
+        return None
+
+    args = _filter_values(filters, [])
+    expression = f"{agg}({target})"
+    sql = f'SELECT {expression} AS "{agg}" FROM public.{table}{where}'
+    if having is not None:
+        operator, value = having
+        args.append(value)
+        sql += f" HAVING {expression} {_SQL_OPERATORS[operator]} ${len(args)}"
+    return f"SELECT coalesce(json_agg(_row), '[]')::text FROM ({sql}) AS _row", args
+
+
+def _build_operation_sql(operation: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Translate one operation of a batch to SQL, raising ValueError if it cannot be."""
+    action = operation.get("action")
+    table_name = operation.get("table_name", "")
+    filters = operation.get("filters")
+    if action in ("update", "delete") and not filters:
+        raise ValueError(f"A batch {action} operation requires filters")
+
+    if action == "read":
+        statement = _build_select_sql(table_name, operation.get("columns", "*"), filters)
+        if statement is not None:
+            sql, args = statement
+            statement = f"SELECT coalesce(json_agg(_row), '[]')::text FROM ({sql}) AS _row", args
+    elif action == "create":
+        statement = _build_insert_sql(table_name, operation.get("data") or [])
+    elif action == "update":
+        statement = _build_update_sql(table_name, operation.get("data") or {}, filters)
+    elif action == "delete":
+        statement = _build_delete_sql(table_name, filters)
+    else:
+        raise ValueError(f"Unsupported batch action: {action}")
+
+    if statement is None:
+        raise ValueError(
+            f"Batch {action} on '{table_name}' must use plain table and column names"
+        )
+    return statement
+
+
+async def _read_direct(
+    table_name: str,
+    columns: str,
+    filters: Optional[List[FilterSpec]],
+    page_size: int,
+    max_rows: Optional[int],
+    order_by: Optional[str],
+) -> Optional[Tuple[List[str], int, bool]]:
+    """
+    Serve a read from the direct connection pool, or return None if it has to go through PostgREST.
+
+    asyncpg keeps the prepared statement for each query shape on every connection, so
+    repeated reads skip parsing and planning as well as PostgREST's HTTP and JSON overhead.
+    Rows are fetched through a server-side cursor, page_size rows at a time, and encoded
+    with row_to_json so they match what PostgREST would return.
+
+    Returns the JSON text of each row, which is passed on without being decoded, the
+    number of rows, and whether the row limit was reached.
+    """
+    if _DB_POOL is None:
+        return None
+    statement = _build_select_sql(table_name, columns, filters, max_rows, order_by)
+    if statement is None:
+        return None
+    sql, args = statement
+    sql = f"SELECT row_to_json(_row)::text FROM ({sql}) AS _row"
+    try:
+        async with _DB_POOL.acquire() as connection:
+            async with connection.transaction(readonly=True):
+                rows = [row[0] async for row in connection.cursor(sql, *args, prefetch=page_size)]
+    except asyncpg.DataError:
+        # A value could not be encoded as the column's type (e.g. a timestamp given as a
+        # string); PostgREST sends values as text and lets the database cast them.
+        return None
+    return rows, len(rows), max_rows is not None and len(rows) >= max_rows
+
+
+async def _raw_execute(query) -> httpx.Response:
+    """
+    Send a PostgREST query and return the HTTP response without decoding its body.
+
+    This is the request half of the query builder's execute(); the response is not
+    validated into an APIResponse, so its JSON can be handed on as it arrived.
+    """
+    response = await send_with_retry(query.request)
+    if response.is_success:
+        return response
+    try:
+        error = response.json()
+    except ValueError:
+        raise APIError(generate_default_error_message(response)) from None
+    raise APIError(error)
+
+
+def _page_size(response: httpx.Response, body: str) -> int:
+    """Count the rows in a page from its Content-Range (e.g. "0-24/*"), or from the body if it is missing."""
+    content_range = response.headers.get("Content-Range")
+    if content_range is None:
+        return len(from_json(body))
+    rows = content_range.split("/")[0]
+    if rows == "*":
+        return 0
+    start, end = rows.split("-")
+    return int(end) - int(start) + 1
+
+
+async def _read_postgrest(
+    table_name: str,
+    columns: str,
+    filters: Optional[List[FilterSpec]],
+    page_size: int,
+    max_rows: Optional[int],
+    order_by: Optional[str],
+) -> Tuple[List[str], int, bool]:
+    """
+    Read through PostgREST one page (range) of page_size rows at a time, so no single
+    response has to hold the whole result.
+
+    Pages are fetched by offset, which only partitions the rows if they are in a stable
+    order, so reads without order_by are a single request for at most page_size rows.
+    Ordered reads continue until a page comes back empty rather than short, as PostgREST
+    also shortens pages that exceed the project's "Max rows" setting.
+
+    Returns the JSON text of each non-empty page, without its enclosing brackets, the
+    number of rows, and whether the read stopped at a limit while more rows may match.
+    """
+    pages: List[str] = []
+    count = 0
+    while max_rows is None or count < max_rows:
+        size = page_size if max_rows is None else min(page_size, max_rows - count)
+        query = _ASYNC_SUPABASE.table(table_name).select(columns)
+        if filters:
+            query = _apply_filters(query, filters)
+        if order_by is not None:
+            query = query.order(order_by)
+        response = await _raw_execute(query.range(count, count + size - 1))
+        body = response.text.strip()
+        received = _page_size(response, body)
+        if received:
+            pages.append(body[1:-1])
+        count += received
+        if order_by is None:
+            return pages, count, count >= size
+        if not received:
+            return pages, count, False
+    return pages, count, True
+
+
+def _read_result(items: List[str], count: int, truncated: bool) -> str:
+    """Assemble the JSON document returned by read_rows from the JSON text of its rows."""
+    result = '{"data": [' + ",".join(items) + '], "count": null'
+    if truncated:
+        result += ', "truncated": true'
+    return result + "}"
+
+
+# Row limit applied to read_rows calls that do not set max_rows; set to 0 to disable
+DEFAULT_READ_LIMIT = int(os.environ.get("MCP_DEFAULT_READ_LIMIT", "1000"))
+
+# Successful read_rows results are cached for this many seconds; set to 0 to disable caching
+READ_CACHE_TTL = float(os.environ.get("MCP_READ_CACHE_TTL", "30"))
+READ_CACHE_MAXSIZE = 1024
+
+_READ_CACHE: TTLCache = TTLCache(maxsize=READ_CACHE_MAXSIZE, ttl=READ_CACHE_TTL)
+
+# Bumped whenever a table's cached reads are invalidated (and under None when the whole
+# cache is cleared), so a read that was in flight during a write does not cache its result
+_CACHE_GENERATIONS: Dict[Optional[str], int] = {}
+
+
+def _cache_generation(table_name: str) -> Tuple[int, int]:
+    return (_CACHE_GENERATIONS.get(None, 0), _CACHE_GENERATIONS.get(table_name, 0))
+
+
+def _freeze(value: Any) -> Any:
+    """
+    Convert lists (e.g. the values of an "in" filter) and Filters to tuples, and dicts (JSON
+    filter values) to tagged tuples of their items, so they can be hashed. A Filter shares
+    its cache entry with the equivalent tuple.
+    """
+    if isinstance(value, (list, tuple, Filter)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        # Tagged so a dict does not share a key with a list of [key, value] pairs
+        items = sorted(((str(key), _freeze(item)) for key, item in value.items()), key=lambda pair: pair[0])
+        return (dict, tuple(items))
+    return value
+
+
+def _read_cache_key(
+    table_name: str,
+    columns: str,
+    filters: Optional[List[FilterSpec]],
+    order_by: Optional[str],
+    page_size: int,
+    max_rows: Optional[int],
+) -> Tuple[Any, ...]:
+    """
+    Build a cache key for a read, independent of the order the filters were given in.
+    page_size is part of the key, as it bounds unordered reads through PostgREST.
+    """
+    filter_key = tuple(sorted((_freeze(f) for f in filters or ()), key=repr))
+    return (table_name, columns, filter_key, order_by, page_size, max_rows)
+
+
+def _invalidate_cache(table_name: str) -> int:
+    """Drop all cached reads of a table, returning the number of entries removed."""
+    _CACHE_GENERATIONS[table_name] = _CACHE_GENERATIONS.get(table_name, 0) + 1
+    stale = [key for key in list(_READ_CACHE) if key[0] == table_name]
+    for key in stale:
+        _READ_CACHE.pop(key, None)
+    return len(stale)
+
+
+# Inserts into the same table arriving within this window are sent as one request
+BATCH_WINDOW_MS = 5
+# Upper bound on the rows coalesced into a single insert, to stay under PostgREST payload limits
+MAX_BATCH_ROWS = 500
+
+
+class _PendingInsert:
+    """Rows waiting to be inserted together, and the callers waiting on them."""
+
+    def __init__(self, timer: asyncio.TimerHandle):
+        self.timer = timer
+        self.rows: List[Dict[str, Any]] = []
+        self.callers: List[Tuple[int, asyncio.Future]] = []
+
+
+class _InsertBatcher:
+    """
+    Coalesce concurrent inserts into the same table into a single multi-row insert.
+
+    Inserts are only coalesced with others targeting the same set of columns, so
+    PostgREST fills in missing columns exactly as it would for separate requests.
+    Each caller receives the slice of the returned rows that corresponds to its own data.
+    """
+
+    def __init__(self, window_ms: float = BATCH_WINDOW_MS, max_rows: int = MAX_BATCH_ROWS):
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self._pending: Dict[Tuple[str, FrozenSet[str]], _PendingInsert] = {}
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def insert(self, table_name: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        key = (table_name, frozenset(column for row in rows for column in row))
+
+        batch = self._pending.get(key)
+        if batch is not None and len(batch.rows) + len(rows) > self.max_rows:
+            self._flush(key)
+            batch = None
+        if batch is None:
+            batch = self._pending[key] = _PendingInsert(loop.call_later(self.window, self._flush, key))
+
+        future = loop.create_future()
+        batch.rows.extend(rows)
+        batch.callers.append((len(rows), future))
+        if len(batch.rows) >= self.max_rows:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: Tuple[str, FrozenSet[str]]) -> None:
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = asyncio.create_task(self._execute(key[0], batch))
+        # Keep a reference so the task is not garbage collected before it completes
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _execute(self, table_name: str, batch: _PendingInsert) -> None:
+        try:
+            response = await _ASYNC_SUPABASE.table(table_name).insert(batch.rows).execute()
+            result = _serialize(response)
+        except Exception as e:
+            for _, future in batch.callers:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        data = result.get("data") or []
+        offset = 0
+        for size, future in batch.callers:
+            if not future.done():
+                future.set_result({**result, "data": data[offset:offset + size]})
+            offset += size
+
+
+_INSERT_BATCHER = _InsertBatcher()
+
+
+def _serialize(response: APIResponse) -> Dict[str, Any]:
+    """
+    Convert a PostgREST response to the dictionary returned by the tools.
+
+    The rows have already been decoded from JSON into plain Python objects, so they are
+    passed through as-is instead of being copied again by the model's model_dump().
+    """
+    return {"data": response.data, "count": response.count}
+
+
+def _tool_errors(func):
+    """
+    Turn any exception a tool does not handle itself into an error result, so that errors
+    reach the client as a message instead of failing the call. Errors with a specific format
+    (e.g. APIError) are still handled by the tools.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            return {"error": f"An unexpected error occurred: {str(e)}"}
+
+    return wrapper
+
+
 # Create the FastMCP server instance
 mcp = FastMCP(
     "Supabase MCP Server",
     lifespan=lifespan,
-    dependencies=["supabase", "python-dotenv", "gotrue"],
+    dependencies=["supabase", "python-dotenv", "gotrue", "cachetools", "asyncpg"],
 )
 
 
-@mcp.tool()
-def read_rows(
+@mcp.tool(structured_output=False)
+@_tool_errors
+async def read_rows(
     table_name: str, 
     columns: str = "*", 
-    filters: Optional[List[Tuple[str, str, Any]]] = None
-) -> Dict[str, Any]:
+    filters: Optional[List[FilterSpec]] = None,
+    page_size: int = 1000,
+    max_rows: Optional[int] = None,
+    order_by: Optional[str] = None,
+) -> Union[TextContent, Dict[str, Any]]:
     """
     Read rows from a specified table in the Supabase database with advanced filtering.
 
@@ -76,31 +822,141 @@ def read_rows(
         filters: A list of filters to apply to the query. Each filter is a tuple of
                  (column_name, operator, value).
                  Supported operators: "eq", "neq", "gt", "lt", "gte", "lte", "like", "in".
+                 Filters can be combined with ("or", [filters...]), ("and", [filters...])
+                 and ("not", filter); all filters in the list must match.
                  Example: [("country", "eq", "New Zealand"), ("id", "gt", 2)]
+                 Example: [("or", [("status", "eq", "open"), ("priority", "gte", 3)])]
+        page_size: The number of rows fetched from the database per request. Should not exceed
+                   the project's "Max rows" API setting (1000 by default).
+        max_rows: The maximum number of rows to return. Defaults to MCP_DEFAULT_READ_LIMIT
+                  (1000) rows; pass a larger value to read more.
+        order_by: A column to sort the rows by, in ascending order. Should be unique, e.g.
+                  the primary key, so the order of the rows is fully determined.
+
+    Through PostgREST, results larger than page_size are fetched page by page, which
+    requires order_by: pages are fetched by offset, and without a stable order they can
+    overlap or miss rows. A read without order_by is a single request for at most page_size
+    rows, marked "truncated" if it is full. Pages are separate requests, so a result
+    spanning several pages can still be inconsistent if the table is modified while it is
+    being read.
+
+    If SUPABASE_DB_URL is set, reads that can be expressed in plain SQL are served over a
+    direct database connection instead of PostgREST, as a single query that is not
+    limited to page_size rows.
+
+    Results are cached for a short time (MCP_READ_CACHE_TTL seconds) and invalidated whenever
+    this server writes to the same table.
 
     Returns:
-        A dictionary containing the result of the query or an error message.
+        The result of the query as a JSON document with "data" and "count", or a dictionary
+        with an error message. If the row limit was reached, "truncated" is set to true, as
+        more rows may match. The rows are returned as JSON exactly as the database sent them,
+        rather than being decoded and encoded again.
     """
     try:
-        supabase: Client = mcp.get_context().request_context.lifespan_context["supabase_client"]
-        query = supabase.table(table_name).select(columns)
+        if max_rows is None and DEFAULT_READ_LIMIT > 0:
+            max_rows = DEFAULT_READ_LIMIT
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        if max_rows is not None and max_rows < 0:
+            raise ValueError("max_rows must not be negative")
+        key = _read_cache_key(table_name, columns, filters, order_by, page_size, max_rows)
+        result = _READ_CACHE.get(key)
+        if result is None:
+            generation = _cache_generation(table_name)
+            rows = await _read_direct(table_name, columns, filters, page_size, max_rows, order_by)
+            if rows is None:
+                rows = await _read_postgrest(table_name, columns, filters, page_size, max_rows, order_by)
+            result = _read_result(*rows)
+            # Only cache the result if the table was not written to while it was being read
+            if _cache_generation(table_name) == generation:
+                _READ_CACHE[key] = result
+        return TextContent(type="text", text=result)
+    except APIError as e:
+        return {"error": f"Supabase API Error: {e.message}", "details": e.details}
+    except asyncpg.PostgresError as e:
+        return {"error": f"Database Error: {e}", "details": getattr(e, "detail", None)}
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+@mcp.tool()
+@_tool_errors
+async def aggregate_rows(
+    table_name: str,
+    agg: Literal["count", "sum", "avg", "min", "max"],
+    column: str = "*",
+    filters: Optional[List[FilterSpec]] = None,
+    having: Optional[Tuple[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Compute an aggregate over the rows of a table in the database, instead of reading the
+    rows and aggregating them client-side.
+
+    Args:
+        table_name: The name of the table to aggregate.
+        agg: The aggregate function: "count", "sum", "avg", "min" or "max".
+        column: The column to aggregate. Defaults to "*", which is only valid for "count".
+        filters: A list of filters selecting the rows to aggregate, in the same format as read_rows.
+        having: An optional (operator, value) condition on the aggregated value, e.g. ("gt", 100).
+                Supported operators: "eq", "neq", "gt", "lt", "gte", "lte".
+
+    Without SUPABASE_DB_URL, aggregates other than counting all rows require PostgREST
+    aggregate functions to be enabled for the project.
+
+    Returns:
+        A dictionary whose "data" holds a single row with the aggregated value, keyed by the
+        aggregate name, e.g. {"data": [{"sum": 42}]}. "data" is empty if the having condition
+        is not met. Returns an error message on failure.
+    """
+    try:
+        if having is not None:
+            _having_operator(having[0])
+
+        statement = _build_aggregate_sql(table_name, agg, column, filters, having) if _DB_POOL else None
+        if statement is not None:
+            sql, args = statement
+            try:
+                async with _DB_POOL.acquire() as connection:
+                    return {"data": from_json(await connection.fetchval(sql, *args))}
+            except asyncpg.DataError:
+                # A value could not be encoded as the aggregate's type; retry through PostgREST
+                pass
+
+        supabase = _ASYNC_SUPABASE
+        count_rows = agg == "count" and column.strip() == "*"
+        if count_rows:
+            query = supabase.table(table_name).select("*", count="exact", head=True)
+        else:
+            query = supabase.table(table_name).select(f"{column.strip()}.{agg}()")
         if filters:
             query = _apply_filters(query, filters)
-        response = query.execute()
-        return response.model_dump()
+        response = await query.execute()
+        value = response.count if count_rows else (response.data[0][agg] if response.data else None)
+
+        # The aggregate is a single value by now, so the having condition is checked here
+        if having is not None:
+            operator, threshold = having
+            if value is None or not _having_operator(operator)(value, threshold):
+                return {"data": []}
+        return {"data": [{agg: value}]}
     except APIError as e:
         return {"error": f"Supabase API Error: {e.message}", "details": e.details}
+    except asyncpg.PostgresError as e:
+        return {"error": f"Database Error: {e}", "details": getattr(e, "detail", None)}
     except ValueError as e:
         return {"error": str(e)}
-    except Exception as e:
-        return {"error": f"An unexpected error occurred: {str(e)}"}
 
 
 @mcp.tool()
-def create_records(table_name: str, data: List[Dict[str, Any]]) -> Dict[str, Any]:
+@_tool_errors
+async def create_records(table_name: str, data: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
     Create one or more records in a specified table in the Supabase database.
 
+    Concurrent calls targeting the same table and columns are coalesced into a single
+    multi-row insert, so they succeed or fail together.
+
     Args:
         table_name: The name of the table to insert records into.
         data: A list of dictionaries, where each dictionary represents a record to be created.
@@ -109,20 +965,19 @@ def create_records(table_name: str, data: List[Dict[str, Any]]) -> Dict[str, Any
         A dictionary containing the result of the insert operation or an error message.
     """
     try:
-        supabase: Client = mcp.get_context().request_context.lifespan_context["supabase_client"]
-        response = supabase.table(table_name).insert(data).execute()
-        return response.model_dump()
+        result = await _INSERT_BATCHER.insert(table_name, data)
+        _invalidate_cache(table_name)
+        return result
     except APIError as e:
         return {"error": f"Supabase API Error: {e.message}", "details": e.details}
-    except Exception as e:
-        return {"error": f"An unexpected error occurred: {str(e)}"}
 
 
 @mcp.tool()
-def update_records(
+@_tool_errors
+async def update_records(
     table_name: str, 
     data: Dict[str, Any], 
-    filters: List[Tuple[str, str, Any]]
+    filters: List[FilterSpec]
 ) -> Dict[str, Any]:
     """
     Update one or more records in a specified table based on advanced filters.
@@ -133,28 +988,78 @@ def update_records(
         filters: A list of filters to identify the records to update. Each filter is a tuple of
                  (column_name, operator, value).
                  Supported operators: "eq", "neq", "gt", "lt", "gte", "lte", "like", "in".
+                 Filters can be combined with ("or", [filters...]), ("and", [filters...])
+                 and ("not", filter).
 
     Returns:
         A dictionary containing the result of the update operation or an error message.
     """
     try:
-        supabase: Client = mcp.get_context().request_context.lifespan_context["supabase_client"]
+        supabase = _ASYNC_SUPABASE
         query = supabase.table(table_name).update(data)
         query = _apply_filters(query, filters)
-        response = query.execute()
-        return response.model_dump()
+        response = await query.execute()
+        _invalidate_cache(table_name)
+        return _serialize(response)
     except APIError as e:
         return {"error": f"Supabase API Error: {e.message}", "details": e.details}
     except ValueError as e:
         return {"error": str(e)}
-    except Exception as e:
-        return {"error": f"An unexpected error occurred: {str(e)}"}
 
 
 @mcp.tool()
-def delete_records(
+@_tool_errors
+async def bulk_update(
+    table_name: str,
+    rows: List[Dict[str, Any]],
+    on_conflict: str = "id"
+) -> Dict[str, Any]:
+    """
+    Update many records with different values by upserting them on their key column(s),
+    with one request per distinct set of columns among the rows.
+
+    Rows are grouped by the columns they set, because an upsert writes every column it
+    sends: a column missing from one row of a request would be set to NULL for that row.
+    Each group is a separate request, so if one fails, the groups before it remain applied.
+
+    The upsert is an INSERT ... ON CONFLICT DO UPDATE, and Postgres checks NOT NULL
+    constraints on the proposed insert before resolving the conflict. Rows that leave out
+    a NOT NULL column without a default therefore fail even if the record exists; use
+    update_records for such partial updates.
+
+    Args:
+        table_name: The name of the table to update records in.
+        rows: A list of dictionaries, each holding the key column(s) of a record and its
+              new values. Rows whose key does not exist yet are inserted.
+        on_conflict: A comma-separated string of the column(s) identifying a record.
+                     Defaults to "id".
+
+    Returns:
+        A dictionary containing the upserted records of all groups or an error message.
+    """
+    try:
+        supabase = _ASYNC_SUPABASE
+        groups: Dict[FrozenSet[str], List[Dict[str, Any]]] = {}
+        for row in rows:
+            groups.setdefault(frozenset(row), []).append(row)
+        data: List[Any] = []
+        try:
+            for group in groups.values():
+                response = await supabase.table(table_name).upsert(group, on_conflict=on_conflict).execute()
+                data.extend(response.data)
+        finally:
+            # Earlier groups may have been written even if a later one failed
+            _invalidate_cache(table_name)
+        return {"data": data, "count": None}
+    except APIError as e:
+        return {"error": f"Supabase API Error: {e.message}", "details": e.details}
+
+
+@mcp.tool()
+@_tool_errors
+async def delete_records(
     table_name: str, 
-    filters: List[Tuple[str, str, Any]]
+    filters: List[FilterSpec]
 ) -> Dict[str, Any]:
     """
     Delete one or more records from a specified table based on advanced filters.
@@ -164,22 +1069,90 @@ def delete_records(
         filters: A list of filters to identify the records to delete. Each filter is a tuple of
                  (column_name, operator, value).
                  Supported operators: "eq", "neq", "gt", "lt", "gte", "lte", "like", "in".
+                 Filters can be combined with ("or", [filters...]), ("and", [filters...])
+                 and ("not", filter).
 
     Returns:
         A dictionary containing the result of the delete operation or an error message.
     """
     try:
-        supabase: Client = mcp.get_context().request_context.lifespan_context["supabase_client"]
+        supabase = _ASYNC_SUPABASE
         query = supabase.table(table_name).delete()
         query = _apply_filters(query, filters)
-        response = query.execute()
-        return response.model_dump()
+        response = await query.execute()
+        _invalidate_cache(table_name)
+        return _serialize(response)
     except APIError as e:
         return {"error": f"Supabase API Error: {e.message}", "details": e.details}
     except ValueError as e:
         return {"error": str(e)}
-    except Exception as e:
-        return {"error": f"An unexpected error occurred: {str(e)}"}
+
+
+@mcp.tool()
+@_tool_errors
+async def batch(operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Run several operations atomically, in order, in a single database transaction.
+    Requires a direct database connection (SUPABASE_DB_URL).
+
+    Args:
+        operations: A list of operations. Each operation is a dictionary with an "action"
+                    ("read", "create", "update" or "delete"), a "table_name", and the
+                    arguments of the corresponding tool:
+                    - read: optional "columns" and "filters"
+                    - create: "data", a list of records
+                    - update: "data", a dictionary of new values, and "filters"
+                    - delete: "filters"
+                    Filters use the same format as the other tools. Later operations see
+                    the changes made by earlier ones; if any operation fails, none are applied.
+                    Example: [{"action": "update", "table_name": "stock", "data": {"qty": 4},
+                               "filters": [("id", "eq", 1)]},
+                              {"action": "read", "table_name": "stock", "filters": [("qty", "lt", 5)]}]
+
+    Returns:
+        A dictionary whose "data" holds the rows returned by each operation, in order,
+        or an error message.
+    """
+    index = 0
+    try:
+        if _DB_POOL is None:
+            raise ValueError("The batch tool requires SUPABASE_DB_URL to be set.")
+        statements = [_build_operation_sql(operation) for operation in operations]
+        results = []
+        async with _DB_POOL.acquire() as connection:
+            async with connection.transaction():
+                for index, (sql, args) in enumerate(statements):
+                    results.append(from_json(await connection.fetchval(sql, *args)))
+        for table_name in {op["table_name"] for op in operations if op["action"] != "read"}:
+            _invalidate_cache(table_name)
+        return {"data": results}
+    except asyncpg.PostgresError as e:
+        return {
+            "error": f"Database Error in operation {index}: {e}",
+            "details": getattr(e, "detail", None),
+        }
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+@mcp.tool()
+async def cache_clear(table_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Clear cached read_rows results, e.g. after the data was changed outside of this server.
+
+    Args:
+        table_name: The table whose cached reads should be cleared. Clears all tables if omitted.
+
+    Returns:
+        A dictionary containing the number of cache entries removed.
+    """
+    if table_name is None:
+        cleared = len(_READ_CACHE)
+        _CACHE_GENERATIONS[None] = _CACHE_GENERATIONS.get(None, 0) + 1
+        _READ_CACHE.clear()
+    else:
+        cleared = _invalidate_cache(table_name)
+    return {"cleared": cleared}
 
 
 if __name__ == "__main__":
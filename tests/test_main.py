@@ -1,139 +1,675 @@
+import asyncio
+import json
+import httpx
 import pytest
-from unittest.mock import MagicMock, patch
-from main import read_rows, create_records, update_records, delete_records, mcp
+from unittest.mock import AsyncMock, MagicMock, patch
+import main
+from main import read_rows, aggregate_rows, create_records, update_records, bulk_update, delete_records, batch, cache_clear
 from postgrest import APIResponse, APIError
+from mcp.types import TextContent
 
-# Mock the Lifespan Context
-# This prevents the real Supabase client from being created during tests.
-mcp.get_context = MagicMock()
+RAW_EXECUTE = main._raw_execute
+
+async def _raw_execute(query):
+    """Stand-in for main._raw_execute that sends the mocked query's response as raw JSON."""
+    response = await query.execute()
+    content_range = f"0-{len(response.data) - 1}/*" if response.data else "*/*"
+    return httpx.Response(200, json=response.data, headers={"Content-Range": content_range})
+
+def _parse(result):
+    """Decode the raw JSON returned by read_rows; error results are plain dictionaries."""
+    return json.loads(result.text) if isinstance(result, TextContent) else result
 
 @pytest.fixture
-def mock_supabase_client():
+def mock_supabase_client(monkeypatch):
     """Fixture to create a mock Supabase client."""
     client = MagicMock()
-    # The lifespan context stores the client in a dictionary
-    mcp.get_context.return_value.request_context.lifespan_context = {"supabase_client": client}
+    # The lifespan caches the clients on the module, so the real ones are never created
+    monkeypatch.setattr(main, "_ASYNC_SUPABASE", client)
+    monkeypatch.setattr(main, "_DB_POOL", None)
+    monkeypatch.setattr(main, "_raw_execute", _raw_execute)
+    main._READ_CACHE.clear()
     return client
 
 def test_read_rows_success(mock_supabase_client):
     """Test successful reading of rows with and without filters."""
-    # Mock the chain of calls: table -> select -> eq -> execute
-    mock_response = MagicMock(spec=APIResponse)
-    mock_response.model_dump.return_value = {"data": [{"id": 1, "name": "Test"}]}
+    # Mock the chain of calls: table -> select -> filter -> range -> execute
+    mock_response = APIResponse(data=[{"id": 1, "name": "Test"}])
     
     mock_query_builder = MagicMock()
-    mock_query_builder.execute.return_value = mock_response
-    mock_query_builder.eq.return_value = mock_query_builder
+    mock_query_builder.execute = AsyncMock(return_value=mock_response)
+    mock_query_builder.filter.return_value = mock_query_builder
+    mock_query_builder.range.return_value = mock_query_builder
 
     mock_supabase_client.table.return_value.select.return_value = mock_query_builder
 
     # Test without filters
-    result = read_rows("test_table")
+    result = _parse(asyncio.run(read_rows("test_table")))
     mock_supabase_client.table.assert_called_with("test_table")
     mock_supabase_client.table.return_value.select.assert_called_with("*")
-    assert result == {"data": [{"id": 1, "name": "Test"}]}
+    assert result == {"data": [{"id": 1, "name": "Test"}], "count": None}
 
     # Test with a filter
     filters = [("name", "eq", "Test")]
-    result = read_rows("test_table", columns="name", filters=filters)
+    result = _parse(asyncio.run(read_rows("test_table", columns="name", filters=filters)))
     mock_supabase_client.table.assert_called_with("test_table")
     mock_supabase_client.table.return_value.select.assert_called_with("name")
-    mock_query_builder.eq.assert_called_with("name", "Test")
-    assert result == {"data": [{"id": 1, "name": "Test"}]}
+    mock_query_builder.filter.assert_called_with("name", "eq", "Test")
+    assert result == {"data": [{"id": 1, "name": "Test"}], "count": None}
+
+def test_read_rows_cached(mock_supabase_client):
+    """Test that identical reads are served from the cache until the table is written to."""
+    mock_response = APIResponse(data=[{"id": 1, "name": "Test"}])
+
+    mock_query_builder = MagicMock()
+    mock_query_builder.execute = AsyncMock(return_value=mock_response)
+    mock_query_builder.filter.return_value = mock_query_builder
+    mock_query_builder.range.return_value = mock_query_builder
+    mock_supabase_client.table.return_value.select.return_value = mock_query_builder
+    mock_supabase_client.table.return_value.delete.return_value = mock_query_builder
+
+    asyncio.run(read_rows("test_table", filters=[("name", "eq", "Test"), ("id", "gt", 0)]))
+    # Filter order does not matter
+    second = _parse(asyncio.run(read_rows("test_table", filters=[("id", "gt", 0), ("name", "eq", "Test")])))
+    assert mock_query_builder.execute.await_count == 1
+    assert second == {"data": [{"id": 1, "name": "Test"}], "count": None}
+
+    asyncio.run(delete_records("test_table", [("id", "eq", 1)]))
+    asyncio.run(read_rows("test_table", filters=[("name", "eq", "Test"), ("id", "gt", 0)]))
+    assert mock_query_builder.execute.await_count == 3
+
+def test_read_rows_json_filter_values(mock_supabase_client):
+    """Test that reads filtering on JSON values are sent as JSON and can be cached."""
+    mock_query_builder = MagicMock()
+    mock_query_builder.execute = AsyncMock(return_value=APIResponse(data=[{"id": 1}]))
+    mock_query_builder.filter.return_value = mock_query_builder
+    mock_query_builder.range.return_value = mock_query_builder
+    mock_supabase_client.table.return_value.select.return_value = mock_query_builder
+
+    filters = [("meta", "eq", {"a": 1}), ("tags", "in", [{"b": 2}, {"c": [3]}])]
+    result = _parse(asyncio.run(read_rows("test_table", filters=filters)))
+    mock_query_builder.filter.assert_any_call("meta", "eq", '{"a":1}')
+    mock_query_builder.filter.assert_any_call("tags", "in", '("{\\"b\\":2}","{\\"c\\":[3]}")')
+    assert result == {"data": [{"id": 1}], "count": None}
+
+    asyncio.run(read_rows("test_table", filters=[("tags", "in", [{"b": 2}, {"c": [3]}]), ("meta", "eq", {"a": 1})]))
+    assert mock_query_builder.execute.await_count == 1
+    # A list of pairs is a different filter value from a dict
+    assert main._freeze({"a": 1}) != main._freeze([["a", 1]])
+
+def test_read_rows_not_cached_across_concurrent_write(mock_supabase_client):
+    """Test that a read overlapping a write to the same table does not cache its stale result."""
+    read_builder = MagicMock()
+    read_builder.range.return_value = read_builder
+    mock_supabase_client.table.return_value.select.return_value = read_builder
+    delete_builder = MagicMock()
+    delete_builder.filter.return_value = delete_builder
+    delete_builder.execute = AsyncMock(return_value=APIResponse(data=[{"id": 1}]))
+    mock_supabase_client.table.return_value.delete.return_value = delete_builder
+
+    async def interleave():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_read():
+            started.set()
+            await release.wait()
+            return APIResponse(data=[{"id": 1}])
+
+        read_builder.execute = AsyncMock(side_effect=slow_read)
+        read = asyncio.create_task(read_rows("test_table"))
+        await started.wait()
+        # The write completes while the read is still waiting for its response
+        await delete_records("test_table", [("id", "eq", 1)])
+        release.set()
+        return await read
+
+    assert _parse(asyncio.run(interleave())) == {"data": [{"id": 1}], "count": None}
+    assert len(main._READ_CACHE) == 0
+
+    read_builder.execute = AsyncMock(return_value=APIResponse(data=[]))
+    assert _parse(asyncio.run(read_rows("test_table"))) == {"data": [], "count": None}
+    assert len(main._READ_CACHE) == 1
+
+def test_cache_clear(mock_supabase_client):
+    """Test clearing cached reads for one table or for all tables."""
+    mock_response = APIResponse(data=[])
+    mock_supabase_client.table.return_value.select.return_value.range.return_value.execute = AsyncMock(return_value=mock_response)
+
+    asyncio.run(read_rows("table_a"))
+    asyncio.run(read_rows("table_b"))
+    assert asyncio.run(cache_clear("table_a")) == {"cleared": 1}
+    assert asyncio.run(cache_clear()) == {"cleared": 1}
+
+def test_read_rows_paginated(mock_supabase_client):
+    """Test that ordered reads are fetched one page at a time, up to max_rows or an empty page."""
+    mock_query_builder = MagicMock()
+    mock_query_builder.order.return_value = mock_query_builder
+    mock_query_builder.range.return_value = mock_query_builder
+    mock_query_builder.execute = AsyncMock(side_effect=[
+        APIResponse(data=[{"id": 1}, {"id": 2}]),
+        APIResponse(data=[{"id": 3}]),
+        APIResponse(data=[]),
+    ])
+    mock_supabase_client.table.return_value.select.return_value = mock_query_builder
+
+    result = _parse(asyncio.run(read_rows("test_table", page_size=2, max_rows=10, order_by="id")))
+    mock_query_builder.order.assert_called_with("id")
+    assert [call.args for call in mock_query_builder.range.call_args_list] == [(0, 1), (2, 3), (3, 4)]
+    assert result == {"data": [{"id": 1}, {"id": 2}, {"id": 3}], "count": None}
+
+    mock_query_builder.range.reset_mock()
+    mock_query_builder.execute = AsyncMock(side_effect=[
+        APIResponse(data=[{"id": 1}, {"id": 2}]),
+        APIResponse(data=[{"id": 3}]),
+    ])
+    result = _parse(asyncio.run(read_rows("test_table", page_size=2, max_rows=3, order_by="id")))
+    assert [call.args for call in mock_query_builder.range.call_args_list] == [(0, 1), (2, 2)]
+    assert len(result["data"]) == 3
+    assert result["truncated"] is True
+
+def test_read_rows_paginated_past_server_cap(mock_supabase_client):
+    """Test that pages cut short by the server's row cap do not end an ordered read early."""
+    mock_query_builder = MagicMock()
+    mock_query_builder.order.return_value = mock_query_builder
+    mock_query_builder.range.return_value = mock_query_builder
+    mock_query_builder.execute = AsyncMock(side_effect=[
+        APIResponse(data=[{"id": 1}, {"id": 2}]),
+        APIResponse(data=[{"id": 3}, {"id": 4}]),
+        APIResponse(data=[]),
+    ])
+    mock_supabase_client.table.return_value.select.return_value = mock_query_builder
+
+    result = _parse(asyncio.run(read_rows("test_table", page_size=3, max_rows=10, order_by="id")))
+    assert [call.args for call in mock_query_builder.range.call_args_list] == [(0, 2), (2, 4), (4, 6)]
+    assert result == {"data": [{"id": 1}, {"id": 2}, {"id": 3}, {"id": 4}], "count": None}
+
+def test_read_rows_unordered_single_request(mock_supabase_client):
+    """Test that reads without order_by are not paginated, and are marked truncated when full."""
+    mock_query_builder = MagicMock()
+    mock_query_builder.range.return_value = mock_query_builder
+    mock_query_builder.execute = AsyncMock(return_value=APIResponse(data=[{"id": 1}, {"id": 2}]))
+    mock_supabase_client.table.return_value.select.return_value = mock_query_builder
+
+    result = _parse(asyncio.run(read_rows("test_table", page_size=2, max_rows=10)))
+    mock_query_builder.range.assert_called_once_with(0, 1)
+    mock_query_builder.order.assert_not_called()
+    assert result == {"data": [{"id": 1}, {"id": 2}], "count": None, "truncated": True}
+
+def test_read_rows_default_limit(mock_supabase_client, monkeypatch):
+    """Test that reads without max_rows are capped at the default limit."""
+    monkeypatch.setattr(main, "DEFAULT_READ_LIMIT", 2)
+    mock_query_builder = MagicMock()
+    mock_query_builder.range.return_value = mock_query_builder
+    mock_query_builder.execute = AsyncMock(return_value=APIResponse(data=[{"id": 1}, {"id": 2}]))
+    mock_supabase_client.table.return_value.select.return_value = mock_query_builder
+
+    result = _parse(asyncio.run(read_rows("test_table", page_size=10)))
+
+    mock_query_builder.range.assert_called_once_with(0, 1)
+    assert result == {"data": [{"id": 1}, {"id": 2}], "count": None, "truncated": True}
+
+def test_read_rows_raw_passthrough(mock_supabase_client, monkeypatch):
+    """Test that PostgREST pages are passed on as raw JSON, and errors still raise APIError."""
+    monkeypatch.setattr(main, "_raw_execute", RAW_EXECUTE)
+    mock_query_builder = MagicMock()
+    mock_query_builder.order.return_value = mock_query_builder
+    mock_query_builder.range.return_value = mock_query_builder
+    mock_supabase_client.table.return_value.select.return_value = mock_query_builder
+    pages = [
+        httpx.Response(200, content=b'[{"id":1},\n {"id":2}]', headers={"Content-Range": "0-1/*"}),
+        httpx.Response(200, content=b'[{"id":3}]', headers={"Content-Range": "2-2/*"}),
+        httpx.Response(200, content=b'[]', headers={"Content-Range": "*/*"}),
+    ]
+
+    with patch("main.send_with_retry", AsyncMock(side_effect=pages)):
+        result = asyncio.run(read_rows("test_table", page_size=2, order_by="id"))
+    assert result.text == '{"data": [{"id":1},\n {"id":2},{"id":3}], "count": null}'
+
+    main._READ_CACHE.clear()
+    error = httpx.Response(400, json={"message": "Error message", "details": "Some details"})
+    with patch("main.send_with_retry", AsyncMock(return_value=error)):
+        result = asyncio.run(read_rows("test_table"))
+    assert result == {"error": "Supabase API Error: Error message", "details": "Some details"}
 
 def test_read_rows_api_error(mock_supabase_client):
     """Test APIError handling during read operation."""
     error_data = {"message": "Error message", "details": "Some details"}
-    mock_supabase_client.table.return_value.select.return_value.execute.side_effect = APIError(error_data)
-    result = read_rows("test_table")
+    mock_supabase_client.table.return_value.select.return_value.range.return_value.execute = AsyncMock(side_effect=APIError(error_data))
+    result = asyncio.run(read_rows("test_table"))
     assert "error" in result
     assert result["error"] == "Supabase API Error: Error message"
     assert result["details"] == "Some details"
 
+def test_read_rows_unexpected_error(mock_supabase_client):
+    """Test that unexpected exceptions are returned as an error result."""
+    mock_supabase_client.table.side_effect = RuntimeError("boom")
+    result = asyncio.run(read_rows("test_table"))
+    assert result == {"error": "An unexpected error occurred: boom"}
+
 def test_unsupported_filter_operator(mock_supabase_client):
     """Test that an unsupported filter operator raises a ValueError."""
     filters = [("name", "invalid_op", "Test")]
-    result = read_rows("test_table", filters=filters)
+    result = asyncio.run(read_rows("test_table", filters=filters))
     assert "error" in result
     assert result["error"] == "Unsupported filter operator: invalid_op"
 
+def test_compound_filters(mock_supabase_client):
+    """Test that compound filters are pushed down in PostgREST's logical tree syntax."""
+    mock_response = APIResponse(data=[])
+
+    mock_query_builder = MagicMock()
+    mock_query_builder.execute = AsyncMock(return_value=mock_response)
+    mock_query_builder.filter.return_value = mock_query_builder
+    mock_query_builder.or_.return_value = mock_query_builder
+    mock_query_builder.not_.filter.return_value = mock_query_builder
+    mock_query_builder.range.return_value = mock_query_builder
+    mock_supabase_client.table.return_value.select.return_value = mock_query_builder
+
+    filters = [
+        ("and", [("country", "eq", "New Zealand")]),
+        ("or", [("status", "eq", "a,b"), ("and", [("id", "gt", 2), ("id", "lt", 9)])]),
+        ("not", ("id", "in", [1, 2])),
+    ]
+    asyncio.run(read_rows("test_table", filters=filters))
+
+    mock_query_builder.filter.assert_called_with("country", "eq", "New Zealand")
+    mock_query_builder.or_.assert_called_with('status.eq."a,b",and(id.gt.2,id.lt.9)')
+    mock_query_builder.not_.filter.assert_called_with("id", "in", "(1,2)")
+
+def test_single_eq_filter_fast_path():
+    """Test that a lone eq predicate, as a tuple or a Filter, skips the generic filter dispatch."""
+    for spec in [("id", "eq", 1), main.Filter("id", "eq", 1)]:
+        query = MagicMock()
+        with patch("main._predicate_operator") as predicate_operator, patch("main._filter_criteria") as filter_criteria:
+            assert main._apply_filters(query, [spec]) is query.filter.return_value
+        query.filter.assert_called_once_with("id", "eq", "1")
+        predicate_operator.assert_not_called()
+        filter_criteria.assert_not_called()
+
+    # Other single predicates still take the generic path
+    query = MagicMock()
+    with patch("main._predicate_operator", wraps=main._predicate_operator) as predicate_operator:
+        main._apply_filters(query, [main.Filter("id", "gt", 1)])
+    predicate_operator.assert_called_once()
+    query.filter.assert_called_once_with("id", "gt", "1")
+
+def test_many_filters_sent_as_one_tree(mock_supabase_client):
+    """Test that long filter lists are encoded as a single PostgREST logical tree."""
+    mock_query_builder = MagicMock()
+    mock_query_builder.execute = AsyncMock(return_value=APIResponse(data=[]))
+    mock_query_builder.or_.return_value = mock_query_builder
+    mock_query_builder.range.return_value = mock_query_builder
+    mock_supabase_client.table.return_value.select.return_value = mock_query_builder
+
+    filters = [
+        ("a", "eq", 1),
+        ("b", "gt", 2),
+        ("c", "lte", "x.y"),
+        ("or", [("d", "in", [3, 4]), ("not", ("e", "eq", None))]),
+    ]
+    asyncio.run(read_rows("test_table", filters=filters))
+
+    mock_query_builder.or_.assert_called_once_with('and(a.eq.1,b.gt.2,c.lte."x.y",or(d.in.(3,4),e.not.eq.null))')
+    mock_query_builder.filter.assert_not_called()
+
+def test_filter_objects(mock_supabase_client):
+    """Test that Filter objects validate their operator up front and work like predicate tuples."""
+    with pytest.raises(ValueError, match="Unsupported filter operator: invalid_op"):
+        main.Filter("name", "invalid_op", "Test")
+
+    mock_query_builder = MagicMock()
+    mock_query_builder.execute = AsyncMock(return_value=APIResponse(data=[]))
+    mock_query_builder.filter.return_value = mock_query_builder
+    mock_query_builder.range.return_value = mock_query_builder
+    mock_supabase_client.table.return_value.select.return_value = mock_query_builder
+
+    filters = [main.Filter("id", "in", [1, 2]), ("name", "eq", "Test")]
+    asyncio.run(read_rows("test_table", filters=filters))
+    mock_query_builder.filter.assert_any_call("id", "in", "(1,2)")
+    mock_query_builder.filter.assert_any_call("name", "eq", "Test")
+
+    # A single Filter, with and without the eq operator
+    main._READ_CACHE.clear()
+    assert asyncio.run(read_rows("test_table", filters=[main.Filter("id", "eq", 1)])).text == '{"data": [], "count": null}'
+    mock_query_builder.filter.assert_called_with("id", "eq", "1")
+    asyncio.run(read_rows("test_table", filters=[main.Filter("id", "gt", 1)]))
+    mock_query_builder.filter.assert_called_with("id", "gt", "1")
+
+    assert main._read_cache_key("test_table", "*", filters, None, 1000, 10) == main._read_cache_key(
+        "test_table", "*", [("name", "eq", "Test"), ("id", "in", [1, 2])], None, 1000, 10
+    )
+    assert main._build_select_sql("test_table", "*", [main.Filter("id", "gt", 1)]) == (
+        'SELECT * FROM public."test_table" WHERE "id" > $1', [1]
+    )
+
+def test_unsupported_logical_operator(mock_supabase_client):
+    """Test that an unsupported logical operator raises a ValueError."""
+    result = asyncio.run(read_rows("test_table", filters=[("xor", [("id", "eq", 1)])]))
+    assert result["error"] == "Unsupported logical operator: xor"
+
+@pytest.fixture
+def mock_db_connection(monkeypatch):
+    """Fixture to create a mock direct database connection."""
+    pool = MagicMock()
+    connection = MagicMock()
+    pool.acquire.return_value.__aenter__.return_value = connection
+    monkeypatch.setattr(main, "_DB_POOL", pool)
+    return connection
+
+def test_read_rows_direct(mock_supabase_client, mock_db_connection):
+    """Test that reads expressible in SQL are served from the direct connection."""
+    mock_db_connection.cursor.return_value.__aiter__.return_value = [('{"id": 3, "name": "Test"}',)]
+
+    filters = [("name", "like", "T*"), ("or", [("id", "in", [3, 4]), ("not", ("id", "lte", 2))])]
+    result = _parse(asyncio.run(read_rows("test_table", columns="id, name", filters=filters, max_rows=50)))
+
+    mock_db_connection.transaction.assert_called_once_with(readonly=True)
+    mock_db_connection.cursor.assert_called_once_with(
+        "SELECT row_to_json(_row)::text FROM ("
+        'SELECT "id", "name" FROM public."test_table" '
+        'WHERE "name" LIKE $1 AND ("id" = ANY($2) OR NOT ("id" <= $3)) LIMIT $4'
+        ") AS _row",
+        "T%", [3, 4], 2, 50,
+        prefetch=1000,
+    )
+    mock_supabase_client.table.assert_not_called()
+    assert result == {"data": [{"id": 3, "name": "Test"}], "count": None}
+
+def test_like_filter_with_non_string_value():
+    """Test that like patterns given as numbers are sent to the database as text."""
+    assert main._build_select_sql("test_table", "*", [("code", "like", 5)]) == (
+        'SELECT * FROM public."test_table" WHERE "code" LIKE $1', ["5"]
+    )
+    assert main._build_aggregate_sql("test_table", "count", "*", [("code", "like", 5)], None)[1] == ["5"]
+
+def test_select_sql_reused_across_values():
+    """Test that reads of the same shape reuse the cached SQL and only change the values."""
+    main._select_template.cache_clear()
+
+    first = main._build_select_sql("test_table", "*", [("id", "gt", 1), ("tag", "in", ["a"])])
+    second = main._build_select_sql("test_table", "*", [("id", "gt", 7), ("tag", "in", ["b", "c"])])
+
+    assert first[0] == second[0] == 'SELECT * FROM public."test_table" WHERE "id" > $1 AND "tag" = ANY($2)'
+    assert first[1] == [1, ["a"]]
+    assert second[1] == [7, ["b", "c"]]
+    assert main._select_template.cache_info().hits == 1
+
+    assert main._build_select_sql("test_table", "*", [], 5, "id") == (
+        'SELECT * FROM public."test_table" ORDER BY "id" LIMIT $1', [5]
+    )
+    assert main._build_select_sql("test_table", "*", [], 5, "id.desc") is None
+
+def test_read_rows_direct_falls_back_to_postgrest(mock_supabase_client, mock_db_connection):
+    """Test that reads using PostgREST-only features are not sent to the direct connection."""
+    mock_response = APIResponse(data=[])
+    mock_supabase_client.table.return_value.select.return_value.range.return_value.execute = AsyncMock(return_value=mock_response)
+    result = _parse(asyncio.run(read_rows("test_table", columns="id, author(name)")))
+
+    mock_db_connection.cursor.assert_not_called()
+    mock_supabase_client.table.return_value.select.assert_called_with("id, author(name)")
+    assert result == {"data": [], "count": None}
+
+def test_aggregate_rows_direct(mock_supabase_client, mock_db_connection):
+    """Test that aggregates and their having condition are computed in the database."""
+    mock_db_connection.fetchval = AsyncMock(return_value='[{"sum": 42}]')
+
+    result = asyncio.run(aggregate_rows(
+        "orders", "sum", "amount", filters=[("status", "eq", "paid")], having=("gt", 10)
+    ))
+
+    mock_db_connection.fetchval.assert_awaited_once_with(
+        "SELECT coalesce(json_agg(_row), '[]')::text FROM ("
+        'SELECT sum("amount") AS "sum" FROM public."orders" WHERE "status" = $1 HAVING sum("amount") > $2'
+        ") AS _row",
+        "paid", 10,
+    )
+    assert result == {"data": [{"sum": 42}]}
+
+def test_aggregate_rows_postgrest(mock_supabase_client):
+    """Test aggregates computed through PostgREST, with the having condition applied to the result."""
+    mock_query_builder = MagicMock()
+    mock_query_builder.filter.return_value = mock_query_builder
+    mock_query_builder.execute = AsyncMock(return_value=APIResponse(data=[], count=7))
+    mock_supabase_client.table.return_value.select.return_value = mock_query_builder
+
+    result = asyncio.run(aggregate_rows("orders", "count", filters=[("status", "eq", "paid")]))
+    mock_supabase_client.table.return_value.select.assert_called_with("*", count="exact", head=True)
+    mock_query_builder.filter.assert_called_with("status", "eq", "paid")
+    assert result == {"data": [{"count": 7}]}
+
+    mock_query_builder.execute = AsyncMock(return_value=APIResponse(data=[{"max": 3}]))
+    result = asyncio.run(aggregate_rows("orders", "max", "amount", having=("gte", 5)))
+    mock_supabase_client.table.return_value.select.assert_called_with("amount.max()")
+    assert result == {"data": []}
+
+def test_aggregate_rows_unsupported_having(mock_supabase_client):
+    """Test that an unsupported having operator is rejected."""
+    result = asyncio.run(aggregate_rows("orders", "count", having=("like", 5)))
+    assert result == {"error": "Unsupported having operator: like"}
+
+def test_batch(mock_supabase_client, mock_db_connection):
+    """Test that batch operations run in order inside one transaction."""
+    mock_db_connection.fetchval = AsyncMock(side_effect=['[{"id": 1}]', '[{"id": 1, "qty": 4}]', "[]"])
+    cached_key = main._read_cache_key("stock", "*", None, None, 1000, 1000)
+    main._READ_CACHE[cached_key] = '{"data": [], "count": null}'
+
+    result = asyncio.run(batch([
+        {"action": "create", "table_name": "stock", "data": [{"id": 1}]},
+        {"action": "update", "table_name": "stock", "data": {"qty": 4}, "filters": [("id", "eq", 1)]},
+        {"action": "delete", "table_name": "stock", "filters": [("qty", "lt", 0)]},
+    ]))
+
+    mock_db_connection.transaction.assert_called_once()
+    insert_call, update_call, delete_call = mock_db_connection.fetchval.await_args_list
+    assert insert_call.args == (
+        'WITH _row AS (INSERT INTO public."stock" ("id") SELECT "id" FROM '
+        'json_populate_recordset(NULL::public."stock", $1::json) RETURNING *) '
+        "SELECT coalesce(json_agg(_row), '[]')::text FROM _row",
+        '[{"id": 1}]',
+    )
+    assert update_call.args == (
+        'WITH _row AS (UPDATE public."stock" SET ("qty") = (SELECT "qty" FROM '
+        'json_populate_record(NULL::public."stock", $1::json)) WHERE "id" = $2 RETURNING *) '
+        "SELECT coalesce(json_agg(_row), '[]')::text FROM _row",
+        '{"qty": 4}', 1,
+    )
+    assert delete_call.args[1:] == (0,)
+    assert result == {"data": [[{"id": 1}], [{"id": 1, "qty": 4}], []]}
+    # Writes invalidate cached reads of the table
+    assert cached_key not in main._READ_CACHE
+
+def test_batch_validation(mock_supabase_client, mock_db_connection):
+    """Test that invalid batches are rejected before anything is sent to the database."""
+    mock_db_connection.fetchval = AsyncMock()
+
+    result = asyncio.run(batch([{"action": "delete", "table_name": "stock"}]))
+    assert result == {"error": "A batch delete operation requires filters"}
+    result = asyncio.run(batch([{"action": "upsert", "table_name": "stock"}]))
+    assert result == {"error": "Unsupported batch action: upsert"}
+    mock_db_connection.fetchval.assert_not_called()
+
+def test_batch_requires_direct_connection(mock_supabase_client):
+    """Test that batch reports an error without a direct database connection."""
+    result = asyncio.run(batch([{"action": "read", "table_name": "stock"}]))
+    assert result == {"error": "The batch tool requires SUPABASE_DB_URL to be set."}
+
 def test_create_records_success(mock_supabase_client):
     """Test successful creation of records."""
-    mock_response = MagicMock(spec=APIResponse)
-    mock_response.model_dump.return_value = {"data": [{"id": 1, "name": "New"}]}
-    mock_supabase_client.table.return_value.insert.return_value.execute.return_value = mock_response
+    mock_response = APIResponse(data=[{"id": 1, "name": "New"}])
+    mock_supabase_client.table.return_value.insert.return_value.execute = AsyncMock(return_value=mock_response)
     
     new_data = [{"name": "New"}]
-    result = create_records("test_table", new_data)
+    result = asyncio.run(create_records("test_table", new_data))
 
     mock_supabase_client.table.return_value.insert.assert_called_with(new_data)
-    assert result == {"data": [{"id": 1, "name": "New"}]}
+    assert result == {"data": [{"id": 1, "name": "New"}], "count": None}
+
+def test_create_records_coalesces_concurrent_inserts(mock_supabase_client):
+    """Test that concurrent inserts into the same table are sent as one request."""
+    mock_response = APIResponse(data=[{"id": 1, "name": "A"}, {"id": 2, "name": "B"}, {"id": 3, "name": "C"}])
+    mock_supabase_client.table.return_value.insert.return_value.execute = AsyncMock(return_value=mock_response)
+
+    async def create_concurrently():
+        return await asyncio.gather(
+            create_records("test_table", [{"name": "A"}]),
+            create_records("test_table", [{"name": "B"}, {"name": "C"}]),
+        )
+
+    first, second = asyncio.run(create_concurrently())
+
+    mock_supabase_client.table.return_value.insert.assert_called_once_with(
+        [{"name": "A"}, {"name": "B"}, {"name": "C"}]
+    )
+    assert first == {"data": [{"id": 1, "name": "A"}], "count": None}
+    assert second == {"data": [{"id": 2, "name": "B"}, {"id": 3, "name": "C"}], "count": None}
 
 def test_create_records_failure(mock_supabase_client):
     """Test APIError handling during create operation."""
     error_data = {"message": "Insert failed", "details": "some details"}
-    mock_supabase_client.table.return_value.insert.return_value.execute.side_effect = APIError(error_data)
+    mock_supabase_client.table.return_value.insert.return_value.execute = AsyncMock(side_effect=APIError(error_data))
     
-    result = create_records("test_table", [{"name": "fail"}])
+    result = asyncio.run(create_records("test_table", [{"name": "fail"}]))
     assert "error" in result
     assert "Supabase API Error" in result["error"]
 
 def test_update_records_success(mock_supabase_client):
     """Test successful update of records."""
-    mock_response = MagicMock(spec=APIResponse)
-    mock_response.model_dump.return_value = {"data": [{"id": 1, "name": "Updated"}]}
+    mock_response = APIResponse(data=[{"id": 1, "name": "Updated"}])
     
     mock_query_builder = MagicMock()
-    mock_query_builder.execute.return_value = mock_response
-    mock_query_builder.eq.return_value = mock_query_builder
+    mock_query_builder.execute = AsyncMock(return_value=mock_response)
+    mock_query_builder.filter.return_value = mock_query_builder
 
     mock_supabase_client.table.return_value.update.return_value = mock_query_builder
 
     update_data = {"name": "Updated"}
     filters = [("id", "eq", 1)]
-    result = update_records("test_table", update_data, filters)
+    result = asyncio.run(update_records("test_table", update_data, filters))
 
     mock_supabase_client.table.return_value.update.assert_called_with(update_data)
-    mock_query_builder.eq.assert_called_with("id", 1)
-    assert result == {"data": [{"id": 1, "name": "Updated"}]}
+    mock_query_builder.filter.assert_called_with("id", "eq", "1")
+    assert result == {"data": [{"id": 1, "name": "Updated"}], "count": None}
 
 def test_update_records_failure(mock_supabase_client):
     """Test APIError handling during update operation."""
     mock_query_builder = MagicMock()
     error_data = {"message": "Update failed", "details": "some details"}
-    mock_query_builder.execute.side_effect = APIError(error_data)
-    mock_query_builder.eq.return_value = mock_query_builder
+    mock_query_builder.execute = AsyncMock(side_effect=APIError(error_data))
+    mock_query_builder.filter.return_value = mock_query_builder
     mock_supabase_client.table.return_value.update.return_value = mock_query_builder
 
-    result = update_records("test_table", {"name": "fail"}, [("id", "eq", 1)])
+    result = asyncio.run(update_records("test_table", {"name": "fail"}, [("id", "eq", 1)]))
+    assert "error" in result
+    assert "Supabase API Error" in result["error"]
+
+def test_bulk_update_success(mock_supabase_client):
+    """Test that per-record updates are sent as a single upsert."""
+    mock_response = APIResponse(data=[{"id": 1, "qty": 4}, {"id": 2, "qty": 7}])
+    mock_supabase_client.table.return_value.upsert.return_value.execute = AsyncMock(return_value=mock_response)
+
+    rows = [{"id": 1, "qty": 4}, {"id": 2, "qty": 7}]
+    result = asyncio.run(bulk_update("test_table", rows))
+
+    mock_supabase_client.table.return_value.upsert.assert_called_once_with(rows, on_conflict="id")
+    assert result == {"data": [{"id": 1, "qty": 4}, {"id": 2, "qty": 7}], "count": None}
+
+def test_bulk_update_mixed_columns(mock_supabase_client):
+    """Test that rows setting different columns are upserted separately, so no column is nulled."""
+    upsert = mock_supabase_client.table.return_value.upsert
+    upsert.return_value.execute = AsyncMock(side_effect=[
+        APIResponse(data=[{"id": 1, "qty": 4, "name": "a"}, {"id": 3, "qty": 5, "name": "c"}]),
+        APIResponse(data=[{"id": 2, "qty": 9, "name": "x"}]),
+    ])
+
+    rows = [{"id": 1, "qty": 4}, {"id": 2, "name": "x"}, {"qty": 5, "id": 3}]
+    result = asyncio.run(bulk_update("test_table", rows))
+
+    assert [call.args[0] for call in upsert.call_args_list] == [
+        [{"id": 1, "qty": 4}, {"qty": 5, "id": 3}],
+        [{"id": 2, "name": "x"}],
+    ]
+    assert result == {
+        "data": [{"id": 1, "qty": 4, "name": "a"}, {"id": 3, "qty": 5, "name": "c"}, {"id": 2, "qty": 9, "name": "x"}],
+        "count": None,
+    }
+
+def test_bulk_update_failure(mock_supabase_client):
+    """Test APIError handling during bulk update operation."""
+    error_data = {"message": "Upsert failed", "details": "some details"}
+    mock_supabase_client.table.return_value.upsert.return_value.execute = AsyncMock(side_effect=APIError(error_data))
+
+    result = asyncio.run(bulk_update("test_table", [{"id": 1, "qty": 4}]))
     assert "error" in result
     assert "Supabase API Error" in result["error"]
 
 def test_delete_records_success(mock_supabase_client):
     """Test successful deletion of records."""
-    mock_response = MagicMock(spec=APIResponse)
-    mock_response.model_dump.return_value = {"data": [{"id": 1, "name": "Deleted"}]}
+    mock_response = APIResponse(data=[{"id": 1, "name": "Deleted"}])
     
     mock_query_builder = MagicMock()
-    mock_query_builder.execute.return_value = mock_response
-    mock_query_builder.eq.return_value = mock_query_builder
+    mock_query_builder.execute = AsyncMock(return_value=mock_response)
+    mock_query_builder.filter.return_value = mock_query_builder
 
     mock_supabase_client.table.return_value.delete.return_value = mock_query_builder
 
     filters = [("id", "eq", 1)]
-    result = delete_records("test_table", filters)
+    result = asyncio.run(delete_records("test_table", filters))
 
-    mock_query_builder.eq.assert_called_with("id", 1)
-    assert result == {"data": [{"id": 1, "name": "Deleted"}]}
+    mock_query_builder.filter.assert_called_with("id", "eq", "1")
+    assert result == {"data": [{"id": 1, "name": "Deleted"}], "count": None}
 
 def test_delete_records_failure(mock_supabase_client):
     """Test APIError handling during delete operation."""
     mock_query_builder = MagicMock()
     error_data = {"message": "Delete failed", "details": "some details"}
-    mock_query_builder.execute.side_effect = APIError(error_data)
-    mock_query_builder.eq.return_value = mock_query_builder
+    mock_query_builder.execute = AsyncMock(side_effect=APIError(error_data))
+    mock_query_builder.filter.return_value = mock_query_builder
     mock_supabase_client.table.return_value.delete.return_value = mock_query_builder
 
-    result = delete_records("test_table", [("id", "eq", 1)])
+    result = asyncio.run(delete_records("test_table", [("id", "eq", 1)]))
     assert "error" in result
-    assert "Supabase API Error" in result["error"] 
\ No newline at end of file
+    assert "Supabase API Error" in result["error"] 
+
+def test_lifespan_shares_http_pool(monkeypatch):
+    """Test that the lifespan creates an async client whose services share one sized, keep-alive HTTP pool."""
+    monkeypatch.setenv("SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setenv("SUPABASE_SERVICE_KEY", "service-key")
+    monkeypatch.delenv("SUPABASE_DB_URL", raising=False)
+
+    async def run_lifespan():
+        async with main.lifespan(main.mcp) as context:
+            client = main._ASYNC_SUPABASE
+            assert context.supabase_client is client
+            assert not hasattr(main, "_SUPABASE")
+            assert context.db_pool is None
+            assert client.postgrest.session is client.options.httpx_client
+            assert client.storage.session is client.options.httpx_client
+        assert main._ASYNC_SUPABASE is None
+        return client
+
+    client = asyncio.run(run_lifespan())
+    assert client.options.httpx_client.is_closed
+
+
+def test_lifespan_closes_http_pool_when_startup_fails(monkeypatch):
+    """Test that the HTTP pool is closed if connecting to the database fails during startup."""
+    monkeypatch.setenv("SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setenv("SUPABASE_SERVICE_KEY", "service-key")
+    monkeypatch.setenv("SUPABASE_DB_URL", "postgresql://invalid")
+    http_clients = []
+    create_client = main.acreate_client
+
+    async def recording_acreate_client(url, key, options):
+        http_clients.append(options.httpx_client)
+        return await create_client(url, key, options)
+
+    monkeypatch.setattr(main, "acreate_client", recording_acreate_client)
+    monkeypatch.setattr(main.asyncpg, "create_pool", MagicMock(side_effect=OSError("connection refused")))
+
+    async def run_lifespan():
+        async with main.lifespan(main.mcp):
+            pass
+
+    with pytest.raises(OSError):
+        asyncio.run(run_lifespan())
+    assert http_clients[0].is_closed